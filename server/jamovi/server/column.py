@@ -142,7 +142,9 @@ class Column:
 
     @hidden.setter
     def hidden(self, hidden):
+        old_hidden = self._hidden
         self._hidden = hidden
+        self._parent._on_column_attr_changed(self, 'hidden', old_hidden, hidden)
 
     @property
     def active(self):
@@ -202,7 +204,9 @@ class Column:
     def name(self, name):
         if self._child is None:
             self._create_child()
+        old_name = self._child.name
         self._child.name = name
+        self._parent._on_column_attr_changed(self, 'name', old_name, name)
 
     @property
     def import_name(self):
@@ -220,7 +224,9 @@ class Column:
     def column_type(self, column_type):
         if self._child is None:
             self._create_child()
+        old_type = self._child.column_type
         self._child.column_type = column_type
+        self._parent._on_column_attr_changed(self, 'column_type', old_type, column_type)
 
     @property
     def data_type(self):
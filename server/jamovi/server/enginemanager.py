@@ -4,7 +4,6 @@ import os
 import os.path as path
 import platform
 
-import threading
 import tempfile
 import subprocess
 from enum import Enum
@@ -29,19 +28,30 @@ class Engine:
         RUNNING = 2
         OPPING = 3  # performing operation
 
-    def __init__(self, parent, instance_id, index, session_path, conn_root):
+    PROCESS_CHECK_INTERVAL = 0.5  # seconds
+
+    __slots__ = (
+        '_parent', '_instance_id', '_index', '_session_path',
+        'analysis', 'status',
+        '_process', '_socket', '_recv_fd', '_process_fd', '_process_check',
+        '_message_id',
+        '_restarting', '_stopping', '_stopped',
+        '_ioloop')
+
+    def __init__(self, parent, instance_id, index, session_path):
         self._parent = parent
         self._instance_id = instance_id
         self._index = index
         self._session_path = session_path
-        self._conn_root = conn_root
 
         self.analysis = None
         self.status = Engine.Status.WAITING
 
         self._process = None
         self._socket = None
-        self._thread = None
+        self._recv_fd = None
+        self._process_fd = None
+        self._process_check = None
         self._message_id = 0
         self._restarting = False
         self._stopping = False
@@ -53,7 +63,9 @@ class Engine:
     def is_waiting(self):
         return self.status is Engine.Status.WAITING
 
-    def start(self):
+    @staticmethod
+    def launch(address, session_path):
+        # starts an engine process, and binds the socket it connects to
 
         exe_dir = path.join(conf.get('home'), 'bin')
         exe_path = path.join(exe_dir, 'jamovi-engine')
@@ -81,31 +93,73 @@ class Engine:
         # be a bit wary to make changes to the Popen call
         # seemingly inconsequential changes can break things on windows
 
-        address = self._conn_root + '-' + str(self._index)
         con = '--con={}'.format(address)
-        pth = '--path={}'.format(self._session_path)
+        pth = '--path={}'.format(session_path)
 
-        try:
-            self._process = subprocess.Popen(
-                [exe_path, con, pth],
-                startupinfo=si,
-                stdout=stdout,
-                stderr=stderr,
-                env=env)
+        process = subprocess.Popen(
+            [exe_path, con, pth],
+            startupinfo=si,
+            stdout=stdout,
+            stderr=stderr,
+            env=env)
 
-            self._socket = nanomsg.Socket(nanomsg.PAIR)
-            self._socket._set_recv_timeout(500)
-            self._socket.bind(address)
+        try:
+            socket = nanomsg.Socket(nanomsg.PAIR)
+            socket.bind(address)
+        except BaseException as e:
+            process.terminate()
+            raise e
 
-            self._thread = threading.Thread(target=self._run)
-            self._thread.start()
+        return (process, socket)
 
+    def start(self):
+        try:
+            address = self._parent._new_address()
+            process, socket = Engine.launch(address, self._session_path)
         except BaseException as e:
             self._parent._notify_engine_event({
                 'type': 'error',
                 'message': 'Engine process could not be started',
                 'cause': str(e),
             })
+            return
+
+        self._attach(process, socket)
+
+        if self._restarting:
+            self._parent._notify_engine_restarted(self)
+            self._restarting = False
+
+    def _attach(self, process, socket):
+        self._process = process
+        self._socket = socket
+
+        # nanomsg makes its receive fd readable when a message is
+        # waiting, so we can be woken by the event loop
+        self._recv_fd = socket.recv_fd
+        self._ioloop.add_reader(self._recv_fd, self._on_readable)
+        self._watch_process()
+
+    def _watch_process(self):
+        # where available, a pidfd becomes readable when the process exits,
+        # otherwise we fall back to checking on it periodically
+        try:
+            self._process_fd = os.pidfd_open(self._process.pid)
+        except (AttributeError, OSError):
+            self._process_check = self._ioloop.call_later(
+                Engine.PROCESS_CHECK_INTERVAL,
+                self._check_process)
+        else:
+            self._ioloop.add_reader(self._process_fd, self._check_process)
+
+    def _unwatch_process(self):
+        if self._process_fd is not None:
+            self._ioloop.remove_reader(self._process_fd)
+            os.close(self._process_fd)
+            self._process_fd = None
+        if self._process_check is not None:
+            self._process_check.cancel()
+            self._process_check = None
 
     def stop(self):
         if self._stopped:
@@ -128,31 +182,37 @@ class Engine:
         self._restarting = True
         self.stop()
 
-    def _run(self):
-        parent = threading.main_thread()
-
-        if self._restarting:
-            self._parent._notify_engine_restarted(self)
-            self._restarting = False
-
-        while parent.is_alive():
+    def _on_readable(self):
+        while True:
             try:
-                bytes = self._socket.recv()
-                message = jcoms.ComsMessage()
-                message.ParseFromString(bytes)
-                self._ioloop.call_soon_threadsafe(self._receive, message)
-
+                bytes = self._socket.recv(flags=nanomsg.DONTWAIT)
             except nanomsg.NanoMsgAPIError as e:
-                if e.errno != nanomsg.ETIMEDOUT and e.errno != nanomsg.EAGAIN:
-                    raise e
-
-            self._process.poll()
-            if self._process.returncode is not None:
-                break
+                if e.errno == nanomsg.EAGAIN:
+                    break
+                raise e
 
-        self._ioloop.call_soon_threadsafe(self._on_closing)
+            if self.status is Engine.Status.RUNNING or self.status is Engine.Status.INITING:
+                # parse the results in the same pass as the message
+                message = jcoms.AnalysisResponseMessage()
+            else:
+                message = jcoms.ComsMessage()
+            message.ParseFromString(bytes)
+            self._receive(message)
+
+    def _check_process(self):
+        self._process.poll()
+        if self._process.returncode is None:
+            if self._process_fd is None:
+                self._process_check = self._ioloop.call_later(
+                    Engine.PROCESS_CHECK_INTERVAL,
+                    self._check_process)
+        else:
+            self._unwatch_process()
+            self._on_readable()  # handle anything sent before it exited
+            self._on_closing()
 
     def _on_closing(self):
+        self._ioloop.remove_reader(self._recv_fd)
         self._socket.close()
         if self._restarting:
             log.info('Restarting engine')
@@ -173,20 +233,22 @@ class Engine:
 
     def send(self, analysis, run=True):
 
+        log.debug('sending analysis %s (run: %s) to engine %s', analysis.id, run, self._index)
+
         self._message_id += 1
         self.analysis = analysis
 
-        request = jcoms.AnalysisRequest()
+        request = jcoms.PackedAnalysisRequest()
 
         request.instanceId = self._instance_id
         request.analysisId = analysis.id
         request.name = analysis.name
         request.ns = analysis.ns
+        request.options = analysis.options.as_bytes()  # already serialized
 
         if analysis.status is Analysis.Status.COMPLETE and analysis.needs_op:
 
             analysis.op.waiting = False
-            request.options.CopyFrom(analysis.options.as_pb())
             request.perform = jcoms.AnalysisRequest.Perform.Value('SAVE')
             request.path = analysis.op.path
             request.part = analysis.op.part
@@ -196,7 +258,6 @@ class Engine:
 
             analysis.status = Analysis.Status.RUNNING
 
-            request.options.CopyFrom(analysis.options.as_pb())
             request.changed.extend(analysis.changes)
             request.revision = analysis.revision
             request.clearState = analysis.clear_state
@@ -218,7 +279,7 @@ class Engine:
     def _receive(self, message):
 
         if self.status is Engine.Status.WAITING:
-            log.info('id : {}, response received when not running'.format(message.id))
+            log.info('id : %s, response received when not running', message.id)
         elif self.status is Engine.Status.OPPING:
             self.status = Engine.Status.WAITING
             if message.status == jcoms.Status.Value('ERROR'):
@@ -228,8 +289,7 @@ class Engine:
             self.analysis = None
             self._parent._send_next()
         else:
-            results = jcoms.AnalysisResponse()
-            results.ParseFromString(message.payload)
+            results = message.payload
 
             if results.revision == self.analysis.revision:
                 complete = False
@@ -250,10 +310,13 @@ class Engine:
 
 class EngineManager:
 
+    N_ENGINES = 3
+
     def __init__(self, instance_id, analyses, session_path):
 
         self._instance_id = instance_id
         self._analyses = analyses
+        self._session_path = session_path
         self._analyses.add_options_changed_listener(self._send_next)
 
         if platform.uname().system == 'Windows':
@@ -262,16 +325,21 @@ class EngineManager:
             self._dir = tempfile.TemporaryDirectory()  # assigned to self so it doesn't get cleaned up
             self._conn_root = "ipc://{}/conn".format(self._dir.name)
 
+        self._address_no = 0
+
         self._engine_listeners  = [ ]
 
+        self._restarts = { }  # engine -> future, resolved once it's restarted
+
+        self._ioloop = asyncio.get_event_loop()
+
         self._engines = [ ]
-        for index in range(3):
+        for index in range(EngineManager.N_ENGINES):
             engine = Engine(
                 parent=self,
                 instance_id=instance_id,
                 index=index,
-                session_path=session_path,
-                conn_root=self._conn_root)
+                session_path=session_path)
             self._engines.append(engine)
 
     def start(self):
@@ -279,19 +347,46 @@ class EngineManager:
             self._engines[index].start()
 
     def stop(self):
+        for restart in self._restarts.values():
+            restart.cancel()
+        self._restarts = { }
         for index in range(len(self._engines)):
             self._engines[index].stop()
 
+    def _new_address(self):
+        # each process gets its own address, so a new process is never
+        # bound while a retiring one still holds the old address
+        address = '{}-{}'.format(self._conn_root, self._address_no)
+        self._address_no += 1
+        return address
+
     def restart_engines(self):
-        self._engines_restarted = 0
+        restarts = [ ]
+        for engine in self._engines:
+            superseded = self._restarts.get(engine)
+            if superseded is not None:
+                superseded.cancel()
+            restart = self._ioloop.create_future()
+            self._restarts[engine] = restart
+            restarts.append(restart)
+
         for index in range(len(self._engines)):
             self._engines[index].restart()
 
+        asyncio.ensure_future(self._rerun_when_restarted(restarts))
+
+    async def _rerun_when_restarted(self, restarts):
+        try:
+            await asyncio.gather(*restarts)
+        except asyncio.CancelledError:
+            return  # superseded by a later restart, or stopped
+        for analysis in self._analyses:
+            analysis.rerun()
+
     def _notify_engine_restarted(self, engine):
-        self._engines_restarted += 1
-        if self._engines_restarted == len(self._engines):
-            for analysis in self._analyses:
-                analysis.rerun()
+        restart = self._restarts.pop(engine, None)
+        if restart is not None and not restart.done():
+            restart.set_result(None)
 
     def add_engine_listener(self, listener):
         self._engine_listeners.append(listener)
@@ -7,6 +7,7 @@ import importlib
 from collections import OrderedDict
 
 from jamovi.server.settings import Settings
+from jamovi.server.utils import gen_column_name
 
 from . import omv
 from . import blank
@@ -142,10 +143,10 @@ def fix_column_names(dataset):
     dataset = dataset._dataset
 
     column_names = list(map(lambda column: column.name, dataset))
+    used = set()  # the (fixed) names of the preceding columns
 
     for i in range(len(column_names)):
         orig = column_names[i]
-        used = column_names[:i]
         if orig == '':
             orig = gen_column_name(i)
         else:
@@ -157,24 +158,12 @@ def fix_column_names(dataset):
         while name in used:
             name = '{} ({})'.format(orig, c)
             c += 1
+        used.add(name)
         if name != column_names[i]:
             column_names[i] = name
             dataset[i].name = name
 
 
-def gen_column_name(index):
-    name = ''
-    while True:
-        i = index % 26
-        name = chr(i + 65) + name
-        index -= i
-        index = int(index / 26)
-        index -= 1
-        if index < 0:
-            break
-    return name
-
-
 def _should_embed(path):
     import_cond = settings.get('embedCond')
 
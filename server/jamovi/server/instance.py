@@ -899,21 +899,22 @@ class Instance:
 
         start = -1
         end = -1
-        for i in range(0, len(sortedIndices)):
-            if start == -1:
-                start = sortedIndices[i]
-                end = start
-            elif sortedIndices[i] == end + 1:
-                end += 1
-            else:
-                self._data.delete_rows(start, end)
-                for j in range(i, len(sortedIndices)):
-                    sortedIndices[j] -= end - start + 1
-                start = sortedIndices[i]
-                end = start
+        with self._data.batch_edits():
+            for i in range(0, len(sortedIndices)):
+                if start == -1:
+                    start = sortedIndices[i]
+                    end = start
+                elif sortedIndices[i] == end + 1:
+                    end += 1
+                else:
+                    self._data.delete_rows(start, end)
+                    for j in range(i, len(sortedIndices)):
+                        sortedIndices[j] -= end - start + 1
+                    start = sortedIndices[i]
+                    end = start
 
-        if start is not -1:
-            self._data.delete_rows(start, end)
+            if start != -1:
+                self._data.delete_rows(start, end)
 
         self._populate_schema(request, response)
 
@@ -1,8 +1,13 @@
 
+from itertools import count
+from collections import Counter
+from contextlib import contextmanager
+
 from .transform import Transform
 from .column import Column
 from .analyses import Analyses
 from .utils import NullLog
+from .utils import gen_column_name
 from ..core import ColumnType
 
 
@@ -23,22 +28,34 @@ class InstanceModel:
 
         self._columns = [ ]
         self._transforms = [ ]
+        self._columns_by_id = { }
+        self._columns_by_name = { }  # name -> list of columns with that name
+        self._transforms_by_id = { }
+        self._transforms_by_name = { }
+        self._type_counts = Counter()
+        self._visible_column_count = 0
+        self._filter_column_count = 0
+        self._calculated_columns = set()  # columns which aren't DATA or NONE
+        self._batch_depth = 0
+        self._recalc_pending = False
         self._next_id = 1  # an id of zero is unasigned... zero is reserved for 'no column'
         self._transform_next_id = 1  # an id of zero is unasigned... zero is reserved for 'no transform'
 
         self._log = NullLog()
 
     def __getitem__(self, index_or_name):
-        if type(index_or_name) is int:
+        if isinstance(index_or_name, int):
             index = index_or_name
             return self._columns[index]
         else:
             name = index_or_name
-            for column in self:
-                if column.name == name:
-                    return column
-            else:
+            columns = self._columns_by_name.get(name)
+            if not columns:
                 raise KeyError(name)
+            elif len(columns) == 1:
+                return columns[0]
+            else:
+                return min(columns, key=lambda column: column.index)
 
     def __iter__(self):
         return self._columns.__iter__()
@@ -47,49 +64,50 @@ class InstanceModel:
         self._log = log
 
     def get_column_by_id(self, id):
-        for column in self:
-            if column.id == id:
-                return column
-        else:
+        column = self._columns_by_id.get(id)
+        if column is None:
             raise KeyError('No such column: ' + str(id))
+        return column
 
     def get_transform_by_id(self, id):
-        for transform in self.transforms:
-            if transform.id == id:
-                return transform
-        else:
+        transform = self._transforms_by_id.get(id)
+        if transform is None:
             raise KeyError('No such transform: ' + str(id))
+        return transform
 
     def is_parent_of(self, parent, column, deep):
         if column.parent_id == parent.id:
             return True
-        elif deep and column.parent_id > 0:
-            return self.is_parent_of(parent, self.get_column_by_id(column.parent_id), True)
-        else:
+        elif not deep:
             return False
 
+        visited = set()
+        while column.parent_id > 0:
+            if column.parent_id == parent.id:
+                return True
+            elif column.parent_id in visited:
+                return False  # a cycle which doesn't include parent
+            visited.add(column.parent_id)
+            column = self.get_column_by_id(column.parent_id)
+        return False
+
     def has_circular_parenthood(self, column):
         return self.is_parent_of(column, column, True)
 
     def remove_transform(self, id):
-        i = 0
-        transform = None
-        while i < len(self._transforms):
-            transform = self._transforms[i]
-            if transform.id == id:
-                del self._transforms[i]
-                break
-            else:
-                i += 1
+        transform = self._transforms_by_id.pop(id, None)
+        if transform is not None:
+            self._transforms.remove(transform)
+            if self._transforms_by_name.get(transform.name) is transform:
+                del self._transforms_by_name[transform.name]
         return transform
 
     def append_transform(self, name, id=0, colour_index=0):
         use_id = self._transform_next_id
         if id != 0:
             if id < self._transform_next_id:
-                for existing_transform in self.transforms:
-                    if existing_transform.id == id:
-                        raise KeyError('Transform id already exists: ' + str(id))
+                if id in self._transforms_by_id:
+                    raise KeyError('Transform id already exists: ' + str(id))
             elif id > self._transform_next_id:
                 self._transform_next_id = id
             use_id = id
@@ -102,6 +120,7 @@ class InstanceModel:
         if use_id == self._transform_next_id:
             self._transform_next_id += 1
         self._transforms.append(new_transform)
+        self._transforms_by_id[use_id] = new_transform
 
         return new_transform
 
@@ -132,36 +151,33 @@ class InstanceModel:
             checked_name = name + ' (' + str(i) + ')'
             i += 1
         changed = transform.name != checked_name
+        if self._transforms_by_name.get(transform.name) is transform:
+            del self._transforms_by_name[transform.name]
         transform.name = checked_name
+        self._transforms_by_name[checked_name] = transform
 
         return changed
 
     def set_transform_colour_index(self, transform, colour_index):
-        if colour_index < 0 or self.check_for_transform_colour_index(colour_index, transform):
-            colour_index = 0
+        # colour indices can be assigned directly to transforms, so the set
+        # of colours in use is gathered here rather than kept as an index
+        in_use = set()
+        for existing_transform in self.transforms:
+            if existing_transform is not transform:
+                in_use.add(existing_transform.colour_index)
 
-        while self.check_for_transform_colour_index(colour_index, transform):
-            colour_index += 1
+        if colour_index < 0 or colour_index in in_use:
+            colour_index = next(i for i in count() if i not in in_use)
 
         transform.colour_index = colour_index
 
-    def check_for_transform_colour_index(self, colour_index, exclude_transform):
-        for existing_transform in self.transforms:
-            if colour_index == existing_transform.colour_index and existing_transform is not exclude_transform:
-                return True
-
-        return False
-
     def check_for_transform_name(self, name, exclude_transform):
-        for existing_transform in self.transforms:
-            if name == existing_transform.name and existing_transform is not exclude_transform:
-                return True
-
-        return False
+        existing_transform = self._transforms_by_name.get(name)
+        return existing_transform is not None and existing_transform is not exclude_transform
 
     def check_for_column_name(self, name, exclude_column):
-        for existing_column in self:
-            if name == existing_column.name and existing_column is not exclude_column:
+        for existing_column in self._columns_by_name.get(name, ()):
+            if existing_column is not exclude_column:
                 return True
 
         return False
@@ -170,9 +186,8 @@ class InstanceModel:
         use_id = self._next_id
         if id != 0:
             if id < self._next_id:
-                for existing_column in self:
-                    if existing_column.id == id:
-                        raise KeyError('Column id already exists: ' + str(id))
+                if id in self._columns_by_id:
+                    raise KeyError('Column id already exists: ' + str(id))
             elif id > self._next_id:
                 self._next_id = id
             use_id = id
@@ -187,6 +202,8 @@ class InstanceModel:
         new_column = Column(self, column)
         new_column.index = self.total_column_count
         self._columns.append(new_column)
+        self._index_column(new_column)
+        self._update_filter_column_count()
         return new_column
 
     def begin_edit_tracking(self):
@@ -221,9 +238,8 @@ class InstanceModel:
     def insert_column(self, index, id=0):
         if id != 0:
             if id < self._next_id:
-                for existing_column in self:
-                    if existing_column.id == id:
-                        raise KeyError('Column id already exists: ' + str(id))
+                if id in self._columns_by_id:
+                    raise KeyError('Column id already exists: ' + str(id))
             self._next_id = id
 
         filter_count = self.filter_column_count
@@ -242,66 +258,95 @@ class InstanceModel:
         column = Column(self, child)
         column.column_type = ColumnType.NONE
         self._columns.insert(index, column)
-
-        index = 0
-        for column in self:
-            column.index = index
-            index += 1
+        self._index_column(column)
+        self._update_filter_column_count()
+        self._reindex_columns(index)
 
     def update_filter_names(self):
         filter_index = 0
         subfilter_index = 1
-        filters = []
+        filters = set()
+        FILTER = ColumnType.FILTER
 
         for column in self._columns:
-            if column.column_type is not ColumnType.FILTER:
+            if column.column_type is not FILTER:
                 break
             if column.filter_no in filters:
-                column.name = 'F{} ({})'.format(filter_index, subfilter_index + 1)
+                name = 'F{} ({})'.format(filter_index, subfilter_index + 1)
                 column.filter_no = filter_index - 1
                 subfilter_index += 1
             else:
-                column.name = 'Filter {}'.format(filter_index + 1)
+                name = 'Filter {}'.format(filter_index + 1)
                 if column.filter_no > -1:
-                    filters.append(column.filter_no)
+                    filters.add(column.filter_no)
                 column.filter_no = filter_index
                 filter_index += 1
                 subfilter_index = 1
+            if column.name != name:  # renaming updates the name index
+                column.name = name
+
+    @contextmanager
+    def batch_edits(self):
+        # recalculation is deferred until the outermost batch completes
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._recalc_pending:
+                self._recalc_all()
 
     def update_filter_status(self):
         self._dataset.update_filter_status()
 
     def delete_columns(self, start, end):
-        self._dataset.delete_columns(start, end)
-        del self._columns[start:end + 1]
-
-        for i in range(start, len(self._columns)):
-            self._columns[i].index = i
-
+        self._delete_column_range(start, end)
+        self._reindex_columns(start)
+        self._update_filter_column_count()
         self.update_filter_names()
 
     def delete_columns_by_id(self, ids):
-        sortedIds = sorted(ids, key=lambda id: self.get_column_by_id(id).index)
+        columns = [ self.get_column_by_id(id) for id in ids ]
+        columns.sort(key=lambda column: column.index)
 
+        runs = [ ]
         start = -1
         end = -1
-        for i in range(0, len(sortedIds)):
-            column = self.get_column_by_id(sortedIds[i])
+        for column in columns:
             if start == -1:
                 start = column.index
                 end = start
             elif column.index == end + 1:
                 end += 1
             else:
-                self.delete_columns(start, end)
+                runs.append((start, end))
                 start = column.index
                 end = start
 
-        if start is not -1:
-            self.delete_columns(start, end)
+        if start != -1:
+            runs.append((start, end))
+
+        # deleting from the end backwards leaves the indices of the
+        # remaining runs intact, so the columns need only be reindexed once
+        for start, end in reversed(runs):
+            self._delete_column_range(start, end)
+
+        if len(runs) > 0:
+            self._reindex_columns(runs[0][0])
+            self._update_filter_column_count()
 
         self.update_filter_names()
 
+    def _delete_column_range(self, start, end):
+        for column in self._columns[start:end + 1]:
+            self._unindex_column(column)
+        self._dataset.delete_columns(start, end)
+        del self._columns[start:end + 1]
+
+    def _reindex_columns(self, start=0):
+        for i in range(start, len(self._columns)):
+            self._columns[i].index = i
+
     def is_row_filtered(self, index):
         if index < self._dataset.row_count:
             return self._dataset.is_row_filtered(index)
@@ -345,28 +390,28 @@ class InstanceModel:
 
     def setup(self):
 
-        self._next_id = 1
+        children = list(self._dataset)
+        self._columns.extend([ Column(self, child) for child in children[len(self._columns):] ])
 
-        index = 0
-        for child in self._dataset:
-            if index < len(self._columns):
-                column = self._columns[index]
-            else:
-                column = Column(self, child)
-                self._columns.append(column)
+        columns = self._columns[:len(children)]
+        for index, column in enumerate(columns):
             column.index = index
+        self._next_id = max((column.id for column in columns), default=0) + 1
 
-            index += 1
-
-            if column.id >= self._next_id:
-                self._next_id = column.id + 1
+        self._columns_by_id = { }
+        self._columns_by_name = { }
+        self._type_counts = Counter()
+        self._visible_column_count = 0
+        self._calculated_columns = set()
+        for column in self._columns:
+            self._index_column(column)
+        self._update_filter_column_count()
 
         for transform in self._transforms:
             transform.parse_formula()
 
-        for column in self:
-            if column.column_type is not ColumnType.DATA:
-                column.parse_formula()
+        for column in sorted(self._calculated_columns, key=lambda column: column.index):
+            column.parse_formula()
 
         self._add_virtual_columns()
 
@@ -378,6 +423,7 @@ class InstanceModel:
             column.id = self._next_id
             column.index = index
             self._columns.append(column)
+            self._index_column(column)
             self._next_id += 1
 
     @property
@@ -433,21 +479,11 @@ class InstanceModel:
 
     @property
     def visible_column_count(self):
-        count = 0
-        for column in self._columns:
-            if column.hidden is False:
-                count += 1
-        return count
+        return self._visible_column_count
 
     @property
     def filter_column_count(self):
-        count = 0
-        for column in self._columns:
-            if column.column_type == ColumnType.FILTER:
-                count += 1
-            else:
-                break
-        return count
+        return self._filter_column_count
 
     @property
     def total_column_count(self):
@@ -478,35 +514,17 @@ class InstanceModel:
         self._dataset.blank = blank
 
     def get_column_count_by_type(self, columnType):
-        count = 0
-        for column in self._columns:
-            if column.column_type == columnType:
-                count += 1
-        return count
+        return self._type_counts[columnType]
 
     def _gen_column_name(self, index):
-        name = ''
-        while True:
-            i = index % 26
-            name = chr(i + 65) + name
-            index -= i
-            index = int(index / 26)
-            index -= 1
-            if index < 0:
-                break
+        name = gen_column_name(index)
 
         i = 2
         try_name = name
-        while True:
-            for column in self._dataset:
-                if column.name == try_name:
-                    break  # not unique
-            else:
-                name = try_name
-                break  # unique
+        while try_name in self._columns_by_name:
             try_name = name + ' (' + str(i) + ')'
             i += 1
-        return name
+        return try_name
 
     def _realise_column(self, column):
         index = column.index
@@ -516,14 +534,94 @@ class InstanceModel:
             child = self._dataset.append_column(name)
             wrapper = self[i]
             child.id = wrapper.id
+            self._unindex_column(wrapper)
             wrapper._child = child
+            self._index_column(wrapper)
             wrapper.auto_measure = True
         self._add_virtual_columns()
 
+    def _index_column(self, column):
+        self._columns_by_id[column.id] = column
+        self._index_column_name(column, column.name)
+        self._type_counts[column.column_type] += 1
+        if InstanceModel._is_calculated(column.column_type):
+            self._calculated_columns.add(column)
+        if column.hidden is False:
+            self._visible_column_count += 1
+
+    def _unindex_column(self, column):
+        if self._columns_by_id.get(column.id) is not column:
+            return
+        del self._columns_by_id[column.id]
+        self._unindex_column_name(column, column.name)
+        self._type_counts[column.column_type] -= 1
+        self._calculated_columns.discard(column)
+        if column.hidden is False:
+            self._visible_column_count -= 1
+
+    def _index_column_name(self, column, name):
+        columns = self._columns_by_name.get(name)
+        if columns is None:
+            self._columns_by_name[name] = [ column ]
+        else:
+            columns.append(column)
+
+    def _unindex_column_name(self, column, name):
+        columns = self._columns_by_name.get(name)
+        if columns is None:
+            return
+        for i, existing_column in enumerate(columns):
+            if existing_column is column:
+                del columns[i]
+                break
+        if not columns:
+            del self._columns_by_name[name]
+
+    def _on_column_attr_changed(self, column, attr, old_value, new_value):
+        if self._columns_by_id.get(column.id) is not column:
+            return  # not yet part of the data set
+        if attr == 'name':
+            self._unindex_column_name(column, old_value)
+            self._index_column_name(column, new_value)
+        elif attr == 'column_type':
+            self._type_counts[old_value] -= 1
+            self._type_counts[new_value] += 1
+            if InstanceModel._is_calculated(new_value):
+                self._calculated_columns.add(column)
+            else:
+                self._calculated_columns.discard(column)
+            if old_value is ColumnType.FILTER or new_value is ColumnType.FILTER:
+                self._update_filter_column_count()
+        elif attr == 'hidden':
+            if old_value is False:
+                self._visible_column_count -= 1
+            if new_value is False:
+                self._visible_column_count += 1
+
+    def _update_filter_column_count(self):
+        count = 0
+        for column in self._columns:
+            if column.column_type is not ColumnType.FILTER:
+                break
+            count += 1
+        self._filter_column_count = count
+
+    @staticmethod
+    def _is_calculated(column_type):
+        return column_type is not ColumnType.DATA and column_type is not ColumnType.NONE
+
     def _recalc_all(self):
-        for column in self:
+        if self._batch_depth > 0:
+            self._recalc_pending = True
+            return
+        self._recalc_pending = False
+
+        # only calculated columns need recalculating, but they're kept in
+        # column order, so filters are calculated before the columns they filter
+        columns = sorted(self._calculated_columns, key=lambda column: column.index)
+        for column in columns:
             column.set_needs_recalc()
-        for column in self:
+        for column in columns:
             column.recalc()
 
     def _print_column_info(self):
@@ -94,6 +94,7 @@ class Options:
         self._options = { }
         self._results = None
         self._pb = AnalysisOptions()
+        self._bytes = None  # serialized _pb, cleared whenever _pb changes
 
     def set(self, pb):
         changes = False
@@ -119,6 +120,7 @@ class Options:
                 changed = True
 
             if changed:
+                self._bytes = None
                 if name.startswith('results/'):
                     if not self._results.is_passive(name):
                         changes = True
@@ -129,12 +131,15 @@ class Options:
 
     def read(self, bin):
         self._pb.ParseFromString(bin)
+        self._bytes = None
 
     def as_pb(self):
         return self._pb
 
     def as_bytes(self):
-        return self._pb.SerializeToString()
+        if self._bytes is None:
+            self._bytes = self._pb.SerializeToString()
+        return self._bytes
 
     def compress(self):
         # remove deleted results options (set to null)
@@ -146,6 +151,7 @@ class Options:
             if name.startswith('results/') and pb.o is AnalysisOption.Other.Value('NONE'):
                 del self._pb.names[i]
                 del self._pb.options[i]
+                self._bytes = None
             else:
                 i += 1
 
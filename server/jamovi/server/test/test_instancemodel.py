@@ -0,0 +1,129 @@
+
+import unittest
+
+import os.path
+import random
+import tempfile
+from collections import Counter
+
+from jamovi.core import ColumnType
+from jamovi.core import DataSet
+from jamovi.core import MemoryMap
+from jamovi.server.instancemodel import InstanceModel
+
+
+class TestInstanceModel(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        buffer_path = os.path.join(self._temp_dir.name, 'buffer')
+        self._mm = MemoryMap.create(buffer_path, 4 * 1024 * 1024)
+
+        self._model = InstanceModel()
+        self._model.dataset = DataSet.create(self._mm)
+        for name in ('A', 'B', 'C', 'D', 'E', 'F'):
+            self._model.append_column(name)
+        self._model.setup()
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _assert_indexes(self):
+        # compares the model's indexes and counts against a full rescan
+        model = self._model
+        columns = list(model)
+
+        self.assertEqual([ column.index for column in columns ], list(range(len(columns))))
+
+        self.assertEqual(model._columns_by_id, { column.id: column for column in columns })
+        for column in columns:
+            self.assertIs(model.get_column_by_id(column.id), column)
+
+        by_name = { }
+        for column in columns:
+            by_name.setdefault(column.name, [ ]).append(column)
+        self.assertEqual(
+            { name: set(map(id, named)) for name, named in model._columns_by_name.items() },
+            { name: set(map(id, named)) for name, named in by_name.items() })
+        for name, named in by_name.items():
+            self.assertIs(model[name], named[0])
+
+        type_counts = Counter(column.column_type for column in columns)
+        for column_type in ColumnType:
+            self.assertEqual(model.get_column_count_by_type(column_type), type_counts[column_type])
+
+        self.assertEqual(
+            model.visible_column_count,
+            sum(1 for column in columns if column.hidden is False))
+
+        filter_count = 0
+        for column in columns:
+            if column.column_type is not ColumnType.FILTER:
+                break
+            filter_count += 1
+        self.assertEqual(model.filter_column_count, filter_count)
+
+        self.assertEqual(
+            model._calculated_columns,
+            { column for column in columns
+                if column.column_type is not ColumnType.DATA
+                and column.column_type is not ColumnType.NONE })
+
+    def test_indexes_after_setup(self):
+        self._assert_indexes()
+
+    def test_indexes_after_edits(self):
+        model = self._model
+
+        model.insert_column(2)
+        self._assert_indexes()
+
+        model.set_column_name(model[3], 'A')  # made unique, i.e. 'A (2)'
+        self._assert_indexes()
+
+        model[1].column_type = ColumnType.COMPUTED
+        model[4].hidden = True
+        self._assert_indexes()
+
+        model.insert_column(0)
+        model[0].column_type = ColumnType.FILTER
+        model.insert_column(0)
+        model[0].column_type = ColumnType.FILTER
+        model.update_filter_names()
+        self._assert_indexes()
+
+        virtual = model[model.column_count]
+        virtual.column_type = ColumnType.DATA  # realises the column
+        self._assert_indexes()
+
+        model.delete_columns_by_id([ model[0].id, model[3].id, model[5].id ])
+        self._assert_indexes()
+
+        model.delete_columns(0, 1)
+        self._assert_indexes()
+
+    def test_indexes_after_random_edits(self):
+        model = self._model
+        rand = random.Random(1)
+        column_types = [ ColumnType.DATA, ColumnType.COMPUTED, ColumnType.RECODED ]
+
+        for i in range(200):
+            op = rand.randrange(6)
+            n_columns = model.column_count
+            if op == 0 or n_columns < 2:
+                model.insert_column(rand.randrange(n_columns + 1))
+            elif op == 1:
+                column = model[rand.randrange(n_columns)]
+                model.set_column_name(column, rand.choice([ '', 'A', 'B', 'X' ]))
+            elif op == 2 and model.filter_column_count < n_columns:
+                column = model[rand.randrange(model.filter_column_count, n_columns)]
+                column.column_type = rand.choice(column_types)
+            elif op == 3:
+                column = model[rand.randrange(n_columns)]
+                column.hidden = not column.hidden
+            elif op == 4:
+                columns = rand.sample(list(model)[:n_columns], 2)
+                model.delete_columns_by_id([ column.id for column in columns ])
+            elif op == 5:
+                model[n_columns].column_type = ColumnType.DATA
+            self._assert_indexes()
@@ -6,6 +6,7 @@ from .htmlparser import HTMLParser
 
 from .fileentry import FileEntry
 from .nulllog import NullLog
+from .columnname import gen_column_name
 
 from .typevalues import FValues
 from .typevalues import convert
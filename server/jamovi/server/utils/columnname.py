@@ -0,0 +1,13 @@
+
+def gen_column_name(index):
+    # 0 -> A, 25 -> Z, 26 -> AA, ...
+    name = ''
+    while True:
+        i = index % 26
+        name = chr(i + 65) + name
+        index -= i
+        index = int(index / 26)
+        index -= 1
+        if index < 0:
+            break
+    return name